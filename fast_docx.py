@@ -0,0 +1,129 @@
+"""Minimal DOCX writer for the LVGC export buttons.
+
+The exported documents are just a title plus a flat run of headings and
+paragraphs, so instead of building them with python-docx (lxml, template
+parsing, full package re-serialisation) we write the few OOXML parts Word
+needs straight into a ZIP archive.
+"""
+import io
+import re
+import threading
+import zipfile
+from xml.sax.saxutils import escape
+
+# Paragraph style ids defined in _STYLES below.
+HEADING_1 = "Heading1"
+HEADING_2 = "Heading2"
+
+# --- Static package parts (identical for every document) ---
+_CONTENT_TYPES = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    b'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    b'<Default Extension="xml" ContentType="application/xml"/>'
+    b'<Override PartName="/word/document.xml" '
+    b'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    b'<Override PartName="/word/styles.xml" '
+    b'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    b'</Types>'
+)
+
+_ROOT_RELS = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    b'<Relationship Id="rId1" '
+    b'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    b'Target="word/document.xml"/>'
+    b'</Relationships>'
+)
+
+_DOCUMENT_RELS = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    b'<Relationship Id="rId1" '
+    b'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    b'Target="styles.xml"/>'
+    b'</Relationships>'
+)
+
+_STYLES = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    b'<w:docDefaults>'
+    b'<w:rPrDefault><w:rPr><w:rFonts w:ascii="Calibri" w:hAnsi="Calibri" w:eastAsia="Calibri" w:cs="Calibri"/>'
+    b'<w:sz w:val="22"/><w:szCs w:val="22"/><w:lang w:val="en-GB"/></w:rPr></w:rPrDefault>'
+    b'<w:pPrDefault><w:pPr><w:spacing w:after="160" w:line="259" w:lineRule="auto"/></w:pPr></w:pPrDefault>'
+    b'</w:docDefaults>'
+    b'<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    b'<w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/>'
+    b'<w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>'
+    b'<w:pPr><w:keepNext/><w:spacing w:before="480" w:after="0"/><w:outlineLvl w:val="0"/></w:pPr>'
+    b'<w:rPr><w:b/><w:color w:val="365F91"/><w:sz w:val="28"/><w:szCs w:val="28"/></w:rPr></w:style>'
+    b'<w:style w:type="paragraph" w:styleId="Heading2"><w:name w:val="heading 2"/>'
+    b'<w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>'
+    b'<w:pPr><w:keepNext/><w:spacing w:before="200" w:after="0"/><w:outlineLvl w:val="1"/></w:pPr>'
+    b'<w:rPr><w:b/><w:color w:val="4F81BD"/><w:sz w:val="26"/><w:szCs w:val="26"/></w:rPr></w:style>'
+    b'</w:styles>'
+)
+
+_DOCUMENT_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+)
+# A4 page with 1" margins.
+_DOCUMENT_TAIL = (
+    '<w:sectPr><w:pgSz w:w="11906" w:h="16838"/>'
+    '<w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440" '
+    'w:header="708" w:footer="708" w:gutter="0"/></w:sectPr>'
+    '</w:body></w:document>'
+)
+
+# Characters XML 1.0 doesn't allow in text content.
+_INVALID_XML_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# Line breaks inside a paragraph become <w:br/>, tabs become <w:tab/> (as python-docx does).
+_BREAK_RE = re.compile(r'\r\n|[\r\n\t]')
+
+def _paragraph(style, text):
+    """Returns the <w:p> XML for one paragraph of text in the given style (None for Normal)."""
+    props = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    pieces = []
+    pos = 0
+    text = _INVALID_XML_RE.sub("", text)
+    for match in _BREAK_RE.finditer(text):
+        pieces.append(f'<w:t xml:space="preserve">{escape(text[pos:match.start()])}</w:t>')
+        pieces.append("<w:tab/>" if match.group() == "\t" else "<w:br/>")
+        pos = match.end()
+    pieces.append(f'<w:t xml:space="preserve">{escape(text[pos:])}</w:t>')
+    return f'<w:p>{props}<w:r>{"".join(pieces)}</w:r></w:p>'
+
+# One output buffer per thread, reused across calls so it doesn't regrow from empty each time.
+_BUFFERS = threading.local()
+
+def _reusable_buffer():
+    """Returns this thread's output buffer, rewound to the start."""
+    buffer = getattr(_BUFFERS, "buffer", None)
+    if buffer is None:
+        buffer = _BUFFERS.buffer = io.BytesIO()
+    buffer.seek(0)
+    return buffer
+
+def build_docx(paragraphs):
+    """Returns the bytes of a .docx containing the given (style, text) paragraphs in order."""
+    body = "".join(_paragraph(style, text) for style, text in paragraphs)
+    document = f"{_DOCUMENT_HEAD}{body}{_DOCUMENT_TAIL}".encode("utf-8")
+
+    output = _reusable_buffer()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as package:
+        package.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        package.writestr("_rels/.rels", _ROOT_RELS)
+        package.writestr("word/_rels/document.xml.rels", _DOCUMENT_RELS)
+        package.writestr("word/styles.xml", _STYLES)
+        package.writestr("word/document.xml", document)
+    # Copy out only what this call wrote. The buffer is deliberately not truncated:
+    # BytesIO.truncate frees the storage, which is what reuse is meant to avoid.
+    size = output.tell()
+    view = output.getbuffer()
+    try:
+        return view[:size].tobytes()
+    finally:
+        view.release()
@@ -1,181 +1,495 @@
 import streamlit as st
-import google.generativeai as genai
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import orjson
 import json
+import logging
 import os
 from datetime import datetime
-from docx import Document
-import io
+from pathlib import Path
+from dataclasses import dataclass
+import fast_docx
 import tempfile
+import shutil
 import re
+import hashlib
+import importlib
+import functools
+import threading
+import queue
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
 
 # --- Utility to prettify keys ---
+_CAMEL_RE = re.compile(r'([a-z])([A-Z])')
+
+@functools.lru_cache(maxsize=256)
 def prettify_key(key):
     """Converts a camelCase or snake_case key into a title-cased string."""
-    key = key.replace('_', ' ')
-    key = re.sub(r'([a-z])([A-Z])', r'\1 \2', key)
-    return key.title() + ":"
+    return _CAMEL_RE.sub(r'\1 \2', key.replace('_', ' ')).title() + ":"
+
+# --- Utility to pull the JSON object out of a model response ---
+# Whole fenced blocks (opening fence, optional language tag, body, closing fence), each
+# fence at the start of a line, so one block's closing fence can't open the next.
+_FENCE_RE = re.compile(r"^```(\w*)[ \t]*\n(.*?)^```", re.M | re.S)
+_JSON_DECODER = json.JSONDecoder()
+
+def extract_json(text):
+    """Returns the parsed JSON from a model response, or None if it holds no JSON object.
+
+    Prefers the first untagged or ```json fenced block. Otherwise parses from the first "{";
+    if trailing prose (even with braces) gets in the way, raw_decode stops where that object
+    closes. Raises ValueError if there is a "{" but nothing parses.
+    """
+    for match in _FENCE_RE.finditer(text):
+        if match.group(1).lower() not in ("", "json"):
+            continue  # e.g. a ```python block
+        try:
+            return orjson.loads(match.group(2))
+        except orjson.JSONDecodeError:
+            break  # Not JSON after all; fall back to the brace scan.
+    start = text.find("{")
+    if start == -1:
+        return None
+    try:
+        # Usually the response is just the object, which orjson parses fastest.
+        return orjson.loads(text[start:text.rfind("}") + 1])
+    except orjson.JSONDecodeError:
+        return _JSON_DECODER.raw_decode(text, start)[0]
 
 # --- Lee Valley Golf Club Minutes Generator (Updated) ---
-def generate_golf_club_minutes(structured):
-    """Generates meeting minutes text based on the Lee Valley Golf Club template."""
-    now = datetime.now()
+# Fixed scaffolding of the minutes document, filled via format_map. This only keeps the
+# layout in one place: format_map still parses the template on every call.
+_MINUTES_TEMPLATE = """Title of Meeting: {title}
+Purpose of Meeting: {purpose}
+Location of Meeting: {location}
+Date / Time of Meeting: {meeting_date_time}
+Date / Time of Next Meeting: {next_meeting_date_time}
+Minutes Prepared By: {prepared_by}
+Date Circulated: {date_circulated}
+Circulation: {circulation}
 
+________________________________________
+ATTENDEES:
+{attendees}
+________________________________________
+APOLOGIES:
+{apologies}
+________________________________________
+
+MEETING MINUTES & ACTIONS
+________________________________________
+
+{sections}
+"""
+
+_SEP = "_" * 40
+
+# (MinutesData field / JSON key, heading) for the numbered minutes sections, in document order.
+# Built once per script run (Streamlit re-executes lv.py on every rerun), not once per process.
+_SECTIONS = (
+    ("training", "1. Training (First Aid, Programmes, etc.)"),
+    ("healthAndSafety", "2. Health and Safety"),
+    ("finance", "3. Finance (Status, Projections)"),
+    ("issuesRiskDiscipline", "4. Issues, Risk, Discipline"),
+    ("teams", "5. Teams (Purcell, Bruen, etc.)"),
+    ("projects", "6. Projects (Defib, Simulator, 5 Year Vision)"),
+    ("competitions", "7. Competitions (Weekly, Matchplays)"),
+    ("comments", "8. Comments"),
+    ("anyOtherBusiness", "9. Any Other Business (AOB)"),
+    ("captainsClosingComments", "10. Captain's Closing Comments"),
+)
+# Every list-valued key: attendees/apologies plus the numbered sections.
+_LIST_KEYS = ("attendees", "apologies") + tuple(key for key, _ in _SECTIONS)
+
+@dataclass(frozen=True)
+class MinutesData:
+    """The structured meeting details extracted by Gemini.
+
+    Field names match the JSON keys requested in the structured prompt, so the parsed
+    object maps straight onto the class; keys the model leaves out keep their empty default.
+    """
+    titleOfMeeting: object = None
+    purposeOfMeeting: object = None
+    locationOfMeeting: object = None
+    meetingDateTime: object = None
+    attendees: object = ()
+    apologies: object = ()
+    minutesPreparedBy: object = None
+    dateCirculated: object = None
+    circulation: object = None
+    nextMeetingDateTime: object = None
+    training: object = ()
+    healthAndSafety: object = ()
+    finance: object = ()
+    issuesRiskDiscipline: object = ()
+    teams: object = ()
+    projects: object = ()
+    competitions: object = ()
+    comments: object = ()
+    anyOtherBusiness: object = ()
+    captainsClosingComments: object = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds MinutesData from the parsed JSON dict, ignoring any unexpected keys."""
+        return cls(**{key: value for key, value in data.items() if key in cls.__dataclass_fields__})
+
+# Values the model uses to mean "nothing to report"; compared after strip().casefold().
+_SKIP = frozenset({"", "not mentioned"})
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def generate_golf_club_minutes(data, drafted_date, drafted_datetime):
+    """Generates meeting minutes text from a MinutesData, based on the Lee Valley Golf Club template.
+
+    drafted_date / drafted_datetime fill in the circulation and meeting dates when the
+    transcript doesn't mention them; they are arguments so the cache key includes them.
+    """
     # UPDATED: Helper to get value or fallback to an empty string for cleaner processing.
     # It now performs a case-insensitive check for "not mentioned".
     def get(val, default=""):
-        return val if val and str(val).strip().lower() != "not mentioned" else default
+        s = str(val).strip() if val else ""
+        return val if s.casefold() not in _SKIP else default
+
+    def keep(item):
+        """True if a list item has real content (strips and casefolds it only once)."""
+        return str(item).strip().casefold() not in _SKIP
 
     # UPDATED: Helper for formatting lists. If a section is empty or "Not mentioned",
     # it now returns an empty string, leaving the section blank as requested.
     def format_items(val):
         """Formats a list into bullet points. Returns an empty string if the list is empty."""
-        if isinstance(val, list) and val:
-            # Filter out any empty or placeholder strings from the list before joining
-            items = [item for item in val if str(item).strip() and str(item).strip().lower() != "not mentioned"]
-            if items:
-                return "".join([f"• {item}\n" for item in items])
-        elif isinstance(val, str) and val.strip() and val.strip().lower() != "not mentioned":
+        # Most sections come back as [], so bail out before any type checks.
+        if not val:
+            return ""
+        # Parsed JSON only holds exact list/str types, so a class identity check is enough.
+        if val.__class__ is list:
+            # Filter out placeholders and join the bullets in one pass; kept items are
+            # never empty, so an empty join means there was nothing to list.
+            bullets = "\n• ".join(str(item) for item in val if keep(item))
+            return f"• {bullets}\n" if bullets else ""
+        if val.__class__ is str and keep(val):
             return f"• {val}\n"
         # Return an empty string to leave the section blank if no data is present.
         return ""
 
-    # --- Extract data from the structured JSON using the updated helper ---
-    title = get(structured.get("titleOfMeeting"))
-    purpose = get(structured.get("purposeOfMeeting"))
-    location = get(structured.get("locationOfMeeting"))
-    attendees = structured.get("attendees", [])
-    apologies = structured.get("apologies", [])
-    meeting_date_time = get(structured.get("meetingDateTime"))
-    next_meeting_date_time = get(structured.get("nextMeetingDateTime"))
-    prepared_by = get(structured.get("minutesPreparedBy"))
-    date_circulated = get(structured.get("dateCirculated"))
-    circulation = get(structured.get("circulation"))
-
-    # --- Meeting body items ---
-    training = format_items(structured.get("training", []))
-    health_safety = format_items(structured.get("healthAndSafety", []))
-    finance = format_items(structured.get("finance", []))
-    issues_risk_discipline = format_items(structured.get("issuesRiskDiscipline", []))
-    teams = format_items(structured.get("teams", []))
-    projects = format_items(structured.get("projects", []))
-    competitions = format_items(structured.get("competitions", []))
-    comments = format_items(structured.get("comments", []))
-    aob = format_items(structured.get("anyOtherBusiness", []))
-    captains_comments = format_items(structured.get("captainsClosingComments", []))
+    # --- Extract data from the structured meeting details using the updated helper ---
+    title = get(data.titleOfMeeting)
+    purpose = get(data.purposeOfMeeting)
+    location = get(data.locationOfMeeting)
+    meeting_date_time = get(data.meetingDateTime)
+    next_meeting_date_time = get(data.nextMeetingDateTime)
+    prepared_by = get(data.minutesPreparedBy)
+    date_circulated = get(data.dateCirculated)
+    circulation = get(data.circulation)
+
+    # --- List sections: each field is formatted exactly once ---
+    formatted = {key: format_items(getattr(data, key)) for key in _LIST_KEYS}
 
     # --- Compose the minutes string (Updated with defaults for key fields) ---
-    template = f"""
-Title of Meeting: {title or 'Lee Valley Mens Club Committee Meeting'}
-Purpose of Meeting: {purpose}
-Location of Meeting: {location or 'Lee Valley'}
-Date / Time of Meeting: {meeting_date_time or now.strftime("%d/%m/%Y @ %H:%M")}
-Date / Time of Next Meeting: {next_meeting_date_time}
-Minutes Prepared By: {prepared_by}
-Date Circulated: {date_circulated or now.strftime("%d/%m/%Y")}
-Circulation: {circulation}
+    # Defaults are resolved here; the fixed scaffolding lives in _MINUTES_TEMPLATE.
+    parts = []
+    for key, header in _SECTIONS:
+        parts.append(header)
+        parts.append(formatted[key])
+        parts.append(_SEP)
+    parts.pop()  # no separator after the last section
+    ctx = {
+        "title": title or "Lee Valley Mens Club Committee Meeting",
+        "purpose": purpose,
+        "location": location or "Lee Valley",
+        "meeting_date_time": meeting_date_time or drafted_datetime,
+        "next_meeting_date_time": next_meeting_date_time,
+        "prepared_by": prepared_by,
+        "date_circulated": date_circulated or drafted_date,
+        "circulation": circulation,
+        "attendees": formatted["attendees"] or "• None listed",
+        "apologies": formatted["apologies"] or "• None listed",
+        "sections": "\n".join(parts),
+    }
+    return _MINUTES_TEMPLATE.format_map(ctx).strip()
+
+# --- DOCX Export Functions ---
+# The builders return bytes and are cached on their text, so reruns with unchanged
+# content reuse the serialised document instead of rebuilding it.
+DOCX_SEPARATOR = "-" * 50
+
+def _minutes_paragraphs(content):
+    """Returns (style, text) paragraphs for the minutes, turning section labels and separators into headings/rules."""
+    paragraphs = []
+    for line in content.splitlines():
+        # Strip each line once and reuse it for every check below.
+        line = line.strip()
+        if not line:
+            continue
+        if line.endswith(":") and not line.startswith("•"):
+            paragraphs.append((fast_docx.HEADING_2, line))
+        elif line == _SEP:
+            paragraphs.append((None, DOCX_SEPARATOR))
+        else:
+            paragraphs.append((None, line))
+    return paragraphs
+
+# Report type -> (document heading, body splitter). A splitter of None means the
+# text goes in as a single paragraph.
+_DOCX_CONFIGS = {
+    "narrative": ("Lee Valley Golf Club - Meeting Summary", None),
+    "keypoints": ("Lee Valley Golf Club - Key Points & Actions", None),
+    "minutes": ("Lee Valley Golf Club Meeting Minutes", _minutes_paragraphs),
+}
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def make_docx(kind, text):
+    """Returns DOCX bytes for the given report type ("narrative", "keypoints" or "minutes")."""
+    heading, split_body = _DOCX_CONFIGS[kind]
+    paragraphs = [(fast_docx.HEADING_1, heading)]
+    paragraphs.extend(split_body(text) if split_body else [(None, text)])
+    return fast_docx.build_docx(paragraphs)
+
+create_narrative_docx = functools.partial(make_docx, "narrative")
+create_keypoints_docx = functools.partial(make_docx, "keypoints")
+create_minutes_docx = functools.partial(make_docx, "minutes")
 
-________________________________________
-ATTENDEES:
-{format_items(attendees) or '• None listed'}
-________________________________________
-APOLOGIES:
-{format_items(apologies) or '• None listed'}
-________________________________________
+# --- Configure Gemini API ---
+# The SDK (genai/grpc/protobuf) is imported lazily on first use, which only happens
+# after the password gate, so unauthenticated visitors never pay for it.
+@st.cache_resource
+def get_genai():
+    """Imports and configures the Gemini SDK once per server process and returns the module."""
+    genai = importlib.import_module("google.generativeai")
+    # It's recommended to use st.secrets for API keys. gRPC is already the SDK's default
+    # transport; it is pinned here so an SDK default change can't silently switch it.
+    genai.configure(api_key=st.secrets["GEMINI_API_KEY"], transport="grpc")
+    return genai
+
+@st.cache_resource
+def get_model():
+    """Returns the shared Gemini model, built once per server process."""
+    return get_genai().GenerativeModel(model_name='gemini-1.5-flash')
+
+def _safe_delete_upload(delete_file, name):
+    """Deletes an uploaded file from Gemini; runs off the UI thread, so failures are only logged.
+
+    delete_file is resolved on the script thread: this thread has no ScriptRunContext,
+    so it mustn't call the st.cache_resource getters itself.
+    """
+    try:
+        delete_file(name)
+    except Exception as e:
+        logger.warning("Could not delete uploaded file %s from Gemini: %s", name, e)
+
+# --- Cached Gemini calls ---
+# Responses are cached per transcript so repeat clicks don't re-run the LLM.
+# Bump PROMPT_VERSION whenever one of the prompts below is edited.
+PROMPT_VERSION = 1
+
+def transcript_cache_key(transcript):
+    """Returns the cache key for a transcript: prompt version plus SHA-256 of the text."""
+    digest = hashlib.sha256(transcript.encode("utf-8")).hexdigest()
+    return f"v{PROMPT_VERSION}:{digest}"
+
+# The leading underscore on _transcript tells Streamlit not to hash it; the key covers it.
+@st.cache_data(show_spinner=False, max_entries=32)
+def _gen_structured(cache_key, _transcript, _model):
+    """Asks Gemini for the structured JSON extraction and returns the raw response text."""
+    # UPDATED PROMPT: More explicit instructions to prevent hallucination.
+    prompt_structured = f"""
+You are an AI assistant for Lee Valley Golf Club meetings.
+Your task is to extract detailed, structured information from the provided meeting transcript and return a single JSON object.
+Use UK English. Format all dates as DD/MM/YYYY and all times as HH:MM (24 hour).
 
-MEETING MINUTES & ACTIONS
-________________________________________
+CRITICAL INSTRUCTION: Only extract information explicitly present in the transcript. If a topic or key is not mentioned AT ALL, you MUST use an empty list `[]` for its value. Do NOT invent, infer, or fabricate any information. For example, if 'finance' is not discussed, the value for the 'finance' key must be `[]`.
 
-1. Training (First Aid, Programmes, etc.)
-{training}
-________________________________________
-2. Health and Safety
-{health_safety}
-________________________________________
-3. Finance (Status, Projections)
-{finance}
-________________________________________
-4. Issues, Risk, Discipline
-{issues_risk_discipline}
-________________________________________
-5. Teams (Purcell, Bruen, etc.)
-{teams}
-________________________________________
-6. Projects (Defib, Simulator, 5 Year Vision)
-{projects}
-________________________________________
-7. Competitions (Weekly, Matchplays)
-{competitions}
-________________________________________
-8. Comments
-{comments}
-________________________________________
-9. Any Other Business (AOB)
-{aob}
-________________________________________
-10. Captain's Closing Comments
-{captains_comments}
+Keys to extract:
+- titleOfMeeting
+- purposeOfMeeting
+- locationOfMeeting
+- meetingDateTime
+- attendees (list of names)
+- apologies (list of names)
+- minutesPreparedBy
+- dateCirculated
+- circulation (string describing who gets the minutes)
+- nextMeetingDateTime
+- training (list of key points/actions)
+- healthAndSafety (list of key points/actions)
+- finance (list of key points/actions)
+- issuesRiskDiscipline (list of key points/actions)
+- teams (list of key points/actions, e.g., Purcell, Bruen)
+- projects (list of key points/actions, e.g., Defib, Simulator, 5 Year Vision)
+- competitions (list of key points/actions, e.g., weekly, matchplays)
+- comments (list of general comments made)
+- anyOtherBusiness (list of AOB points)
+- captainsClosingComments (list of points)
+
+Transcript:
+---
+{_transcript}
+---
+
+Provide ONLY the JSON object in your response. Do not include any other text or markdown formatting.
 """
-    return template.strip()
-
-# --- DOCX Export Functions (No changes needed here) ---
-def create_narrative_docx(narrative_text):
-    """Creates a DOCX for the narrative summary."""
-    doc = Document()
-    doc.add_heading("Lee Valley Golf Club - Meeting Summary", level=1)
-    doc.add_paragraph(narrative_text)
-    output = io.BytesIO()
-    doc.save(output)
-    output.seek(0)
-    return output
-
-def create_keypoints_docx(text):
-    """Creates a DOCX for key points and actions."""
-    doc = Document()
-    doc.add_heading("Lee Valley Golf Club - Key Points & Actions", level=1)
-    doc.add_paragraph(text)
-    output = io.BytesIO()
-    doc.save(output)
-    output.seek(0)
-    return output
-
-def create_minutes_docx(content):
-    """Creates a formatted DOCX for the final minutes."""
-    doc = Document()
-    doc.add_heading("Lee Valley Golf Club Meeting Minutes", level=1)
-    # Simple line-by-line processing, can be enhanced for better formatting
-    for line in content.splitlines():
-        if line.strip().endswith(":") and not line.startswith("•"):
-             # Simple check for headings
-            try:
-                doc.add_heading(line.strip(), level=2)
-            except Exception:
-                doc.add_paragraph(line) # Fallback for any heading issues
-        elif line.strip() == "________________________________________":
-            doc.add_paragraph("--------------------------------------------------")
-        elif line.strip():
-            doc.add_paragraph(line)
-
-    output = io.BytesIO()
-    doc.save(output)
-    output.seek(0)
-    return output
+    response = _model.generate_content(prompt_structured, request_options={"timeout": 600})
+    return response.text
 
-# --- Configure Gemini API ---
-try:
-    # It's recommended to use st.secrets for API keys
-    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-    model = genai.GenerativeModel(model_name='gemini-1.5-flash')
-except KeyError:
-    st.error("GEMINI_API_KEY not found in Streamlit secrets. Please add it to continue.")
-    st.stop()
-except Exception as e:
-    st.error(f"Error configuring Gemini API: {e}")
-    st.stop()
+def _narrative_prompt(transcript):
+    """Returns the prompt asking Gemini for a narrative summary of the transcript."""
+    return f"""
+You are an AI assistant creating a professional, concise summary of a Lee Valley Golf Club committee meeting in UK English.
+Based on the following transcript, write a coherent, narrative summary. The summary should be well-organized and capture the main points, discussions, and outcomes.
+
+Transcript:
+---
+{transcript}
+---
+Narrative Summary:"""
+
+def _keypoints_prompt(transcript):
+    """Returns the prompt asking Gemini for bullet-point key points and actions from the transcript."""
+    return f"""
+You are an AI assistant for Lee Valley Golf Club committee meetings.
+Summarise the following transcript into concise bullet points, focusing on:
+- Key discussion points
+- Major decisions made
+- All action items (with responsible persons/roles and deadlines, if mentioned)
+
+Be succinct, avoid repetition, and use bullet points.
+
+Transcript:
+---
+{transcript}
+---"""
+
+_SUMMARY_PROMPTS = {"narrative": _narrative_prompt, "keypoints": _keypoints_prompt}
+
+# The narrative and key points are streamed to the page as Gemini writes them, which
+# st.cache_data can't wrap, so finished texts are cached here under the same key scheme.
+# The cache is shared by every session and written from worker threads, hence the lock.
+# The lock lives in the cached resource with the dict: lv.py re-runs on every rerun, so a
+# module-level lock would be a new object each run while the dict stays the same.
+_SUMMARY_CACHE_SIZE = 32
+
+@st.cache_resource
+def _summary_cache():
+    """Returns the process-wide ({(kind, cache_key): text}, lock) cache for streamed summaries."""
+    return {}, threading.Lock()
+
+def _stream_summary(kind, cache_key, transcript, progress, model, cache):
+    """Streams one summary from Gemini, putting (kind, text so far) on progress; returns the full text.
+
+    model and cache come from get_model() / _summary_cache(), looked up on the script thread.
+    """
+    texts, lock = cache
+    text = texts.get((kind, cache_key))
+    if text is not None:
+        return text
+    response = model.generate_content(
+        _SUMMARY_PROMPTS[kind](transcript), stream=True, request_options={"timeout": 600}
+    )
+    parts = []
+    for chunk in response:
+        parts.append(chunk.text)
+        progress.put((kind, "".join(parts)))
+    text = "".join(parts)
+    with lock:
+        texts[(kind, cache_key)] = text
+        while len(texts) > _SUMMARY_CACHE_SIZE:
+            del texts[next(iter(texts))]  # drop the oldest entry
+    return text
+
+def store_structured_minutes(response_text):
+    """Parses the structured JSON response and stores the structured data and drafted minutes.
+
+    Returns True once the minutes are stored, False if the response couldn't be used.
+    """
+    try:
+        parsed = extract_json(response_text)
+    except ValueError as e:
+        st.error(f"❌ Failed to parse JSON from AI response. Error: {e}")
+        st.code(response_text, language="json")
+        return False
+    if not isinstance(parsed, dict):
+        st.error("❌ No valid JSON object found in Gemini's response for structured summary.")
+        st.code(response_text)
+        return False
+    structured = MinutesData.from_dict(parsed)
+    st.session_state["_lvgc_structured"] = structured
+    # Generate minutes immediately after successful extraction
+    minutes_text = generate_golf_club_minutes(structured, STAMP_DATE, STAMP_DATETIME)
+    st.session_state["_lvgc_minutes"] = minutes_text
+    st.success("Meeting minutes generated in Lee Valley Golf Club format.")
+    return True
+
+def run_all_summaries(transcript, cache_key=None):
+    """Runs the structured, narrative and key-points prompts concurrently and stores each result.
+
+    cache_key is the transcript_cache_key computed at transcription time, if known.
+    The three calls are independent network waits, so total time is the slowest call rather
+    than the sum. The narrative and key points stream onto the page as they are written.
+    Results are handled on this (script) thread as each one completes, and a failure in
+    one doesn't stop the others.
+    """
+    cache_key = cache_key or transcript_cache_key(transcript)
+    # Cached resources are looked up here, on the script thread, and handed to the workers.
+    model, cache = get_model(), _summary_cache()
+    # _gen_structured is itself a st.cache_data function, so its worker gets this run's context.
+    ctx = get_script_run_ctx()
+    # Worker threads can't draw on the page, so streamed text comes back through a queue
+    # and this thread shows it in placeholders until the final results are stored.
+    progress = queue.Queue()
+    previews = {"narrative": st.empty(), "keypoints": st.empty()}
+    preview_titles = {"narrative": "Narrative Summary", "keypoints": "Key Points & Actions"}
+    with ThreadPoolExecutor(
+        max_workers=3, initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    ) as executor:
+        futures = {
+            executor.submit(_gen_structured, cache_key, transcript, model): "structured",
+            executor.submit(_stream_summary, "narrative", cache_key, transcript, progress, model, cache): "narrative",
+            executor.submit(_stream_summary, "keypoints", cache_key, transcript, progress, model, cache): "keypoints",
+        }
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            latest = {}
+            while not progress.empty():
+                kind, text = progress.get_nowait()
+                latest[kind] = text
+            for kind, text in latest.items():
+                previews[kind].markdown(f"**{preview_titles[kind]}** (generating…)\n\n{text}")
+            for future in done:
+                kind = futures[future]
+                # Storing sits inside the try too: a malformed structured response must not
+                # abort the loop before the other results are stored.
+                try:
+                    text = future.result()
+                    if kind == "structured":
+                        stored = False
+                        try:
+                            stored = store_structured_minutes(text)
+                        finally:
+                            if not stored:
+                                # Drop the unusable response so clicking again asks Gemini afresh.
+                                _gen_structured.clear(cache_key, transcript, model)
+                    elif kind == "narrative":
+                        st.session_state["_lvgc_narrative"] = text
+                    else:
+                        st.session_state["_lvgc_keypoints_summary"] = text
+                except Exception as e:
+                    st.error({
+                        "structured": f"An error occurred during summarization: {e}",
+                        "narrative": f"Error generating narrative summary: {e}",
+                        "keypoints": f"Error generating key points summary: {e}",
+                    }[kind])
+    # The finished summaries are rendered in their own section below.
+    for preview in previews.values():
+        preview.empty()
 
 st.set_page_config(page_title="LVGC Minutes", layout="wide", page_icon="https://www.leevalleygcc.ie/wp-content/themes/leevalley/favicon.ico")
 
 # --- Logo Data ---
-logo_url = "https://kerryseniorgolf.com/wp-content/uploads/2022/02/lee-valley-golf-country-club-logo.png"
+# A plain URL: st.image hands it to the browser as-is (no bytes to decode or hash on
+# rerun), and the browser caches the image between reruns.
+LOGO_URL = "https://kerryseniorgolf.com/wp-content/uploads/2022/02/lee-valley-golf-country-club-logo.png"
 
 # --- Password protection ---
 if "password_verified" not in st.session_state:
@@ -201,16 +515,32 @@ if not st.session_state.password_verified:
                 st.error(f"An error occurred during password verification: {e}")
     st.stop()
 
+# --- Timestamps: taken once per run (after the password gate) so every artifact shares the same time ---
+NOW = datetime.now()
+STAMP_FILE = NOW.strftime("%Y%m%d_%H%M")
+STAMP_DATE = NOW.strftime("%d/%m/%Y")
+STAMP_DATETIME = NOW.strftime("%d/%m/%Y @ %H:%M")
+
+# --- Configure Gemini API (authenticated users only) ---
+try:
+    get_model()
+except KeyError:
+    st.error("GEMINI_API_KEY not found in Streamlit secrets. Please add it to continue.")
+    st.stop()
+except Exception as e:
+    st.error(f"Error configuring Gemini API: {e}")
+    st.stop()
+
 # --- Sidebar ---
 with st.sidebar:
-    st.image(logo_url, use_container_width=True)
+    st.image(LOGO_URL, use_container_width=True)
     st.title("📒 LVGC Minutes")
     
     if st.button("🔄 Restart Session"):
-        keys_to_clear = ['transcript', 'structured', 'minutes', 'narrative', 'keypoints_summary']
-        for key in keys_to_clear:
-            if key in st.session_state:
-                del st.session_state[key]
+        # Everything the app stores for a meeting is prefixed with _lvgc_, so one pass
+        # clears it all (and any keys added later) without a hand-maintained list.
+        for key in [key for key in st.session_state if key.startswith("_lvgc_")]:
+            del st.session_state[key]
         st.rerun()
 
     if st.button("About this App", key="about_button_sidebar"):
@@ -226,7 +556,7 @@ with st.sidebar:
 # --- Main UI Header ---
 col1, col2 = st.columns([1, 6])
 with col1:
-    st.image(logo_url, width=180)
+    st.image(LOGO_URL, width=180)
 with col2:
     st.title("📝 LVGC Minutes Recap")
     st.markdown("#### Lee Valley Golf Club Minute-AI (MAI) Generator")
@@ -263,9 +593,7 @@ elif mode == "Record using microphone":
 # --- Transcription and Analysis ---
 if audio_bytes and st.button("🧠 Transcribe & Analyse", key="transcribe_button"):
     with st.spinner("Processing with Gemini... This may take a few minutes for longer audio."):
-        if hasattr(audio_bytes, "read"):
-            audio_data_bytes = audio_bytes.read()
-        else:
+        if not hasattr(audio_bytes, "read"):
             st.error("Could not read audio data. Please try again.")
             st.stop()
         
@@ -276,13 +604,19 @@ if audio_bytes and st.button("🧠 Transcribe & Analyse", key="transcribe_button
                 file_extension = original_extension
 
         with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-            tmp_file.write(audio_data_bytes)
+            if hasattr(audio_bytes, "getbuffer"):
+                # Streamlit's UploadedFile is a BytesIO: write its buffer directly (zero-copy view).
+                tmp_file.write(audio_bytes.getbuffer())
+            else:
+                # Otherwise stream to disk in 1 MiB chunks rather than holding a full copy in memory.
+                audio_bytes.seek(0)
+                shutil.copyfileobj(audio_bytes, tmp_file, length=1024 * 1024)
             tmp_file_path = tmp_file.name
         
         try:
             st.info(f"Uploading audio to Gemini for processing...")
-            audio_file_display_name = f"LVGC_Recap_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            audio_file = genai.upload_file(path=tmp_file_path, display_name=audio_file_display_name)
+            audio_file_display_name = f"LVGC_Recap_{NOW.strftime('%Y%m%d_%H%M%S')}"
+            audio_file = get_genai().upload_file(path=tmp_file_path, display_name=audio_file_display_name)
             st.success(f"Audio uploaded successfully: {audio_file.name}")
 
             prompt = (
@@ -291,179 +625,86 @@ if audio_bytes and st.button("🧠 Transcribe & Analyse", key="transcribe_button
                 "For each speaker, if a name is mentioned, use their name (e.g., Captain:, John Smith:). "
                 "If not, label generically as Speaker 1:, Speaker 2:, etc., incrementing for each new unidentified voice."
             )
-            result = model.generate_content([prompt, audio_file], request_options={"timeout": 1200})
-            st.session_state["transcript"] = result.text
+            result = get_model().generate_content([prompt, audio_file], request_options={"timeout": 1200})
+            st.session_state["_lvgc_transcript"] = result.text
+            # Hash the transcript once here rather than on every summary request.
+            st.session_state["_lvgc_transcript_key"] = transcript_cache_key(result.text)
             st.success("Transcript generated successfully.")
 
         except Exception as e:
             st.error(f"An error occurred during transcription: {e}")
         finally:
             if 'audio_file' in locals() and audio_file:
-                try:
-                    genai.delete_file(audio_file.name)
-                    st.info(f"Cleaned up uploaded file: {audio_file.name}")
-                except Exception as del_e:
-                    st.warning(f"Could not delete uploaded file {audio_file.name} from Gemini: {del_e}")
-            if os.path.exists(tmp_file_path):
-                os.remove(tmp_file_path)
+                # Deleting the upload is another network round-trip; don't make the user wait for it.
+                threading.Thread(
+                    target=_safe_delete_upload, args=(get_genai().delete_file, audio_file.name), daemon=True
+                ).start()
+                st.info(f"Cleaning up uploaded file in the background: {audio_file.name}")
+            # One unlink call; no exists() check, so nothing can race between check and delete.
+            Path(tmp_file_path).unlink(missing_ok=True)
 
 # --- Display Transcript and Generate Minutes ---
-if "transcript" in st.session_state:
+if "_lvgc_transcript" in st.session_state:
     st.markdown("---")
     st.markdown("## 📄 Transcript")
-    st.text_area("Full Meeting Transcript:", st.session_state["transcript"], height=300, key="transcript_display_area")
-
-    if st.button("📊 Extract & Format Meeting Minutes", key="summarise_button"):
-        with st.spinner("Generating structured meeting minutes..."):
-            try:
-                current_transcript = st.session_state['transcript']
-                # UPDATED PROMPT: More explicit instructions to prevent hallucination.
-                prompt_structured = f"""
-You are an AI assistant for Lee Valley Golf Club meetings.
-Your task is to extract detailed, structured information from the provided meeting transcript and return a single JSON object.
-Use UK English. Format all dates as DD/MM/YYYY and all times as HH:MM (24 hour).
+    # Read-only: edits were never used, and disabling it stops edits triggering reruns.
+    st.text_area("Full Meeting Transcript:", st.session_state["_lvgc_transcript"], height=300, key="transcript_display_area", disabled=True)
 
-CRITICAL INSTRUCTION: Only extract information explicitly present in the transcript. If a topic or key is not mentioned AT ALL, you MUST use an empty list `[]` for its value. Do NOT invent, infer, or fabricate any information. For example, if 'finance' is not discussed, the value for the 'finance' key must be `[]`.
-
-Keys to extract:
-- titleOfMeeting
-- purposeOfMeeting
-- locationOfMeeting
-- meetingDateTime
-- attendees (list of names)
-- apologies (list of names)
-- minutesPreparedBy
-- dateCirculated
-- circulation (string describing who gets the minutes)
-- nextMeetingDateTime
-- training (list of key points/actions)
-- healthAndSafety (list of key points/actions)
-- finance (list of key points/actions)
-- issuesRiskDiscipline (list of key points/actions)
-- teams (list of key points/actions, e.g., Purcell, Bruen)
-- projects (list of key points/actions, e.g., Defib, Simulator, 5 Year Vision)
-- competitions (list of key points/actions, e.g., weekly, matchplays)
-- comments (list of general comments made)
-- anyOtherBusiness (list of AOB points)
-- captainsClosingComments (list of points)
-
-Transcript:
----
-{current_transcript}
----
-
-Provide ONLY the JSON object in your response. Do not include any other text or markdown formatting.
-"""
-                response = model.generate_content(prompt_structured, request_options={"timeout": 600})
-                
-                # Clean and parse JSON
-                json_text_match = re.search(r"```json\s*([\s\S]*?)\s*```|({[\s\S]*})", response.text, re.DOTALL)
-                if json_text_match:
-                    json_str = json_text_match.group(1) or json_text_match.group(2)
-                    try:
-                        structured = json.loads(json_str.strip())
-                        st.session_state["structured"] = structured
-                        # Generate minutes immediately after successful extraction
-                        minutes_text = generate_golf_club_minutes(structured)
-                        st.session_state["minutes"] = minutes_text
-                        st.success("Meeting minutes generated in Lee Valley Golf Club format.")
-                    except json.JSONDecodeError as e:
-                        st.error(f"❌ Failed to parse JSON from AI response. Error: {e}")
-                        st.code(json_str.strip(), language="json")
-                else:
-                    st.error("❌ No valid JSON object found in Gemini's response for structured summary.")
-                    st.code(response.text)
-
-            except Exception as e:
-                st.error(f"An error occurred during summarization: {e}")
+    if st.button("🚀 Generate All Outputs (Minutes, Narrative, Key Points)", key="generate_all_button"):
+        with st.spinner("Generating the minutes, narrative summary and key points together..."):
+            run_all_summaries(st.session_state["_lvgc_transcript"], st.session_state.get("_lvgc_transcript_key"))
 
 # --- Display Formatted Minutes and Download ---
-if "minutes" in st.session_state:
+if "_lvgc_minutes" in st.session_state:
     st.markdown("---")
     st.markdown("## ⛳ Lee Valley Golf Club Meeting Minutes (Draft)")
     st.text_area(
         "Drafted Meeting Minutes:",
-        st.session_state["minutes"],
+        st.session_state["_lvgc_minutes"],
         height=900,
         key="minutes_text_area"
     )
     st.download_button(
         label="📥 Download Minutes (DOCX)",
-        data=create_minutes_docx(st.session_state["minutes"]),
-        file_name=f"LeeValleyGC_Minutes_{datetime.now().strftime('%Y%m%d_%H%M')}.docx",
+        data=create_minutes_docx(st.session_state["_lvgc_minutes"]),
+        file_name=f"LeeValleyGC_Minutes_{STAMP_FILE}.docx",
         mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         key="download_minutes_docx"
     )
 
-# --- Generate, Display, and Download Summaries ---
-if "transcript" in st.session_state:
+# --- Display and Download Summaries ---
+# Runs as a fragment so the download buttons only rerun this section, not the
+# transcription and minutes blocks above it.
+@st.fragment
+def summary_section():
     st.markdown("---")
     st.markdown("## 🔍 Meeting Summaries")
     
-    col1, col2 = st.columns(2)
-
-    with col1:
-        if st.button("📝 Generate Narrative Summary", key="narrative_button"):
-            with st.spinner("Creating a narrative summary..."):
-                try:
-                    prompt_narrative = f"""
-You are an AI assistant creating a professional, concise summary of a Lee Valley Golf Club committee meeting in UK English.
-Based on the following transcript, write a coherent, narrative summary. The summary should be well-organized and capture the main points, discussions, and outcomes.
-
-Transcript:
----
-{st.session_state['transcript']}
----
-Narrative Summary:"""
-                    response = model.generate_content(prompt_narrative, request_options={"timeout": 600})
-                    st.session_state["narrative"] = response.text
-                except Exception as e:
-                    st.error(f"Error generating narrative summary: {e}")
-
-    with col2:
-        if st.button("🧾 Generate Key Points & Actions", key="keypoints_button"):
-            with st.spinner("Summarising for key points and actions..."):
-                try:
-                    prompt_keypoints = f"""
-You are an AI assistant for Lee Valley Golf Club committee meetings.
-Summarise the following transcript into concise bullet points, focusing on:
-- Key discussion points
-- Major decisions made
-- All action items (with responsible persons/roles and deadlines, if mentioned)
-
-Be succinct, avoid repetition, and use bullet points.
-
-Transcript:
----
-{st.session_state['transcript']}
----"""
-                    response = model.generate_content(prompt_keypoints, request_options={"timeout": 600})
-                    st.session_state["keypoints_summary"] = response.text
-                except Exception as e:
-                    st.error(f"Error generating key points summary: {e}")
-
-    if "narrative" in st.session_state:
+    if "_lvgc_narrative" in st.session_state:
         st.markdown("### Narrative Summary")
-        st.text_area("Meeting Narrative:", st.session_state["narrative"], height=400, key="narrative_text_area")
+        st.text_area("Meeting Narrative:", st.session_state["_lvgc_narrative"], height=400, key="narrative_text_area")
         st.download_button(
             label="📥 Download Narrative (DOCX)",
-            data=create_narrative_docx(st.session_state["narrative"]),
-            file_name=f"LVGC_Narrative_Summary_{datetime.now().strftime('%Y%m%d_%H%M')}.docx",
+            data=create_narrative_docx(st.session_state["_lvgc_narrative"]),
+            file_name=f"LVGC_Narrative_Summary_{STAMP_FILE}.docx",
             mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
             key="download_narrative_docx"
         )
 
-    if "keypoints_summary" in st.session_state:
+    if "_lvgc_keypoints_summary" in st.session_state:
         st.markdown("### Key Points & Actions")
-        st.text_area("Key Points & Actions:", st.session_state["keypoints_summary"], height=400, key="keypoints_text_area")
+        st.text_area("Key Points & Actions:", st.session_state["_lvgc_keypoints_summary"], height=400, key="keypoints_text_area")
         st.download_button(
             label="📥 Download Key Points (DOCX)",
-            data=create_keypoints_docx(st.session_state["keypoints_summary"]),
-            file_name=f"LVGC_KeyPoints_{datetime.now().strftime('%Y%m%d_%H%M')}.docx",
+            data=create_keypoints_docx(st.session_state["_lvgc_keypoints_summary"]),
+            file_name=f"LVGC_KeyPoints_{STAMP_FILE}.docx",
             mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
             key="download_keypoints_docx"
         )
 
+if "_lvgc_transcript" in st.session_state:
+    summary_section()
+
 # --- Footer ---
 st.markdown("---")
 st.markdown(